@@ -121,7 +121,7 @@ def label_images(metadata,settings):
             im_ms, georef, cloud_mask, im_extra, im_QA, im_nodata = SDS_preprocess.preprocess_single(fn, satname, settings['cloud_mask_issue'])
 
             # compute cloud_cover percentage (with no data pixels)
-            cloud_cover_combined = np.divide(sum(sum(cloud_mask.astype(int))),
+            cloud_cover_combined = np.divide(np.sum(cloud_mask),
                                     (cloud_mask.shape[0]*cloud_mask.shape[1]))
             if cloud_cover_combined > 0.99: # if 99% of cloudy pixels in image skip
                 continue
@@ -129,8 +129,8 @@ def label_images(metadata,settings):
             # remove no data pixels from the cloud mask (for example L7 bands of no data should not be accounted for)
             cloud_mask_adv = np.logical_xor(cloud_mask, im_nodata)
             # compute updated cloud cover percentage (without no data pixels)
-            cloud_cover = np.divide(sum(sum(cloud_mask_adv.astype(int))),
-                                    (sum(sum((~im_nodata).astype(int)))))
+            cloud_cover = np.divide(np.sum(cloud_mask_adv),
+                                    np.sum(~im_nodata))
             # skip image if cloud cover is above threshold
             if cloud_cover > settings['cloud_thresh'] or cloud_cover == 1:
                 continue
@@ -570,7 +570,7 @@ def evaluate_classifier(classifier, metadata, settings):
             image_epsg = metadata[satname]['epsg'][i]
 
             # compute cloud_cover percentage (with no data pixels)
-            cloud_cover_combined = np.divide(sum(sum(cloud_mask.astype(int))),
+            cloud_cover_combined = np.divide(np.sum(cloud_mask),
                                     (cloud_mask.shape[0]*cloud_mask.shape[1]))
             if cloud_cover_combined > 0.99: # if 99% of cloudy pixels in image skip
                 continue
@@ -578,8 +578,8 @@ def evaluate_classifier(classifier, metadata, settings):
             # remove no data pixels from the cloud mask (for example L7 bands of no data should not be accounted for)
             cloud_mask_adv = np.logical_xor(cloud_mask, im_nodata)
             # compute updated cloud cover percentage (without no data pixels)
-            cloud_cover = np.divide(sum(sum(cloud_mask_adv.astype(int))),
-                                    (sum(sum((~im_nodata).astype(int)))))
+            cloud_cover = np.divide(np.sum(cloud_mask_adv),
+                                    np.sum(~im_nodata))
             # skip image if cloud cover is above threshold
             if cloud_cover > settings['cloud_thresh']:
                 continue
@@ -593,7 +593,7 @@ def evaluate_classifier(classifier, metadata, settings):
             # if there are pixels in the 'sand' class --> use find_wl_contours2 (enhanced)
             # otherwise use find_wl_contours2 (traditional)
             try: # use try/except structure for long runs
-                if sum(sum(im_labels[:,:,0])) < 10 :
+                if np.sum(im_labels[:,:,0]) < 10 :
                     # compute MNDWI image (SWIR-G)
                     im_mndwi = SDS_tools.nd_index(im_ms[:,:,4], im_ms[:,:,1], cloud_mask)
                     # find water contours on MNDWI grayscale image
@@ -17,16 +17,20 @@ import ee
 
 # modules to download, unzip and stack the images
 from urllib.request import urlretrieve
+from urllib.error import URLError
+import requests
+from requests.adapters import HTTPAdapter
 import zipfile
 import copy
-import shutil
 from osgeo import gdal
 
 # additional modules
-from datetime import datetime, timedelta
+from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pytz
 import pickle
-from skimage import morphology, transform
+from skimage import morphology
 from scipy import ndimage
 
 # CoastSat modules
@@ -35,6 +39,13 @@ from coastsat import SDS_preprocess, SDS_tools, gdal_merge
 np.seterr(all='ignore') # raise/ignore divisions by 0 and nans
 gdal.PushErrorHandler('CPLQuietErrorHandler')
 
+# persistent HTTP session shared by the download threads (reuses the TLS connections)
+http_session = requests.Session()
+http_session.mount('https://', HTTPAdapter(pool_connections=32, pool_maxsize=32))
+# errors raised when an image cannot be downloaded from the ee server
+download_errors = (ee.EEException, requests.exceptions.RequestException, URLError,
+                   zipfile.BadZipFile, RuntimeError)
+
 # Main function to download images from the EarthEngine server
 def retrieve_images(inputs):
     """
@@ -71,6 +82,8 @@ def retrieve_images(inputs):
             ```
         'filepath_data': str
             filepath to the directory where the images are downloaded
+        'n_workers': int (optional)
+            number of images downloaded in parallel (default is 16)
 
     Returns:
     -----------
@@ -101,182 +114,153 @@ def retrieve_images(inputs):
 
     print('\nDownloading images:')
     suffix = '.tif'
-    for satname in im_dict_T1.keys():
-        print('%s: %d images'%(satname,len(im_dict_T1[satname])))
-        # create subfolder structure to store the different bands
-        filepaths = create_folder_structure(im_folder, satname)
-        # initialise variables and loop through images
-        georef_accs = []; filenames = []; all_names = []; im_epsg = []
-        for i in range(len(im_dict_T1[satname])):
-
-            im_meta = im_dict_T1[satname][i]
-
-            # get time of acquisition (UNIX time) and convert to datetime
-            t = im_meta['properties']['system:time_start']
-            im_timestamp = datetime.fromtimestamp(t/1000, tz=pytz.utc)
-            im_date = im_timestamp.strftime('%Y-%m-%d-%H-%M-%S')
-
-            # get epsg code
-            im_epsg.append(int(im_meta['bands'][0]['crs'][5:]))
-
-            # get geometric accuracy
-            if satname in ['L5','L7','L8','L9']:
-                if 'GEOMETRIC_RMSE_MODEL' in im_meta['properties'].keys():
-                    acc_georef = im_meta['properties']['GEOMETRIC_RMSE_MODEL']
-                else:
-                    acc_georef = 12 # default value of accuracy (RMSE = 12m)
-            elif satname in ['S2']:
-                # Sentinel-2 products don't provide a georeferencing accuracy (RMSE as in Landsat)
-                # but they have a flag indicating if the geometric quality control was passed or failed
-                # if passed a value of 1 is stored if failed a value of -1 is stored in the metadata
-                # the name of the property containing the flag changes across the S2 archive
-                # check which flag name is used for the image and store the 1/-1 for acc_georef
-                flag_names = ['GEOMETRIC_QUALITY_FLAG', 'GEOMETRIC_QUALITY', 'quality_check', 'GENERAL_QUALITY_FLAG']
-                for key in flag_names: 
-                    if key in im_meta['properties'].keys(): break
-                if im_meta['properties'][key] == 'PASSED': acc_georef = 1
-                else: acc_georef = -1
-            georef_accs.append(acc_georef)
-
-            bands = dict([])
-            im_fn = dict([])
-            # first delete dimensions key from dictionnary
-            # otherwise the entire image is extracted (don't know why)
-            im_bands = im_meta['bands']
-            for j in range(len(im_bands)): del im_bands[j]['dimensions']
-
-            # Landsat 5 download
-            if satname == 'L5':
-                bands[''] = [im_bands[0], im_bands[1], im_bands[2], im_bands[3],
-                             im_bands[4], im_bands[7]]
-                im_fn[''] = im_date + '_' + satname + '_' + inputs['sitename'] + suffix
-                # if two images taken at the same date add 'dup' to the name (duplicate)
-                if any(im_fn[''] in _ for _ in all_names):
-                    im_fn[''] = im_date + '_' + satname + '_' + inputs['sitename'] + '_dup' + suffix
-                all_names.append(im_fn[''])
-                filenames.append(im_fn[''])
-                # download .tif from EE
-                while True:
-                    try:
-                        im_ee = ee.Image(im_meta['id'])
-                        local_data = download_tif(im_ee, inputs['polygon'], bands[''], filepaths[1])
-                        break
-                    except:
-                        continue
-                # rename the file as the image is downloaded as 'data.tif'
-                try:
-                    os.rename(local_data, os.path.join(filepaths[1], im_fn['']))
-                except: # overwrite if already exists
-                    os.remove(os.path.join(filepaths[1], im_fn['']))
-                    os.rename(local_data, os.path.join(filepaths[1], im_fn['']))
-                # metadata for .txt file
-                filename_txt = im_fn[''].replace('.tif','')
-                metadict = {'filename':im_fn[''],'acc_georef':georef_accs[i],
-                            'epsg':im_epsg[i]}
-
-            # Landsat 7 and 8 download
-            elif satname in ['L7', 'L8', 'L9']:
-                if satname == 'L7':
-                    bands['pan'] = [im_bands[8]] # panchromatic band
-                    bands['ms'] = [im_bands[0], im_bands[1], im_bands[2], im_bands[3],
-                                   im_bands[4], im_bands[9]] # multispectral bands
-                else:
-                    bands['pan'] = [im_bands[7]] # panchromatic band
-                    bands['ms'] = [im_bands[1], im_bands[2], im_bands[3], im_bands[4],
-                                   im_bands[5], im_bands[11]] # multispectral bands
-                for key in bands.keys():
-                    im_fn[key] = im_date + '_' + satname + '_' + inputs['sitename'] + '_' + key + suffix
-                # if two images taken at the same date add 'dup' to the name (duplicate)
-                if any(im_fn['pan'] in _ for _ in all_names):
+    # number of images downloaded at the same time
+    n_workers = inputs['n_workers'] if 'n_workers' in inputs.keys() else 16
+    # the downloads run in parallel while the next download urls are created
+    executor = ThreadPoolExecutor(max_workers=n_workers)
+    futures = []
+    try:
+        for satname in im_dict_T1.keys():
+            print('%s: %d images'%(satname,len(im_dict_T1[satname])))
+            # create subfolder structure to store the different bands
+            filepaths = create_folder_structure(im_folder, satname)
+            # initialise variables and loop through images
+            georef_accs = []; filenames = []; all_names = []; im_epsg = []; futures = []
+            # number of images to process and number of images skipped
+            n_images = len(im_dict_T1[satname]); n_skipped = 0
+            for i in range(len(im_dict_T1[satname])):
+
+                im_meta = im_dict_T1[satname][i]
+
+                # get time of acquisition (UNIX time) and convert to datetime
+                t = im_meta['properties']['system:time_start']
+                im_timestamp = datetime.fromtimestamp(t/1000, tz=pytz.utc)
+                im_date = im_timestamp.strftime('%Y-%m-%d-%H-%M-%S')
+
+                # get epsg code
+                im_epsg.append(int(im_meta['bands'][0]['crs'][5:]))
+
+                # get geometric accuracy
+                if satname in ['L5','L7','L8','L9']:
+                    if 'GEOMETRIC_RMSE_MODEL' in im_meta['properties'].keys():
+                        acc_georef = im_meta['properties']['GEOMETRIC_RMSE_MODEL']
+                    else:
+                        acc_georef = 12 # default value of accuracy (RMSE = 12m)
+                elif satname in ['S2']:
+                    # Sentinel-2 products don't provide a georeferencing accuracy (RMSE as in Landsat)
+                    # but they have a flag indicating if the geometric quality control was passed or failed
+                    # if passed a value of 1 is stored if failed a value of -1 is stored in the metadata
+                    # the name of the property containing the flag changes across the S2 archive
+                    # check which flag name is used for the image and store the 1/-1 for acc_georef
+                    flag_names = ['GEOMETRIC_QUALITY_FLAG', 'GEOMETRIC_QUALITY', 'quality_check', 'GENERAL_QUALITY_FLAG']
+                    for key in flag_names: 
+                        if key in im_meta['properties'].keys(): break
+                    if im_meta['properties'][key] == 'PASSED': acc_georef = 1
+                    else: acc_georef = -1
+                georef_accs.append(acc_georef)
+
+                bands = dict([])
+                im_fn = dict([])
+                # first delete dimensions key from dictionnary
+                # otherwise the entire image is extracted (don't know why)
+                im_bands = im_meta['bands']
+                for j in range(len(im_bands)): del im_bands[j]['dimensions']
+
+                # Landsat 5 download
+                if satname == 'L5':
+                    bands[''] = [im_bands[0], im_bands[1], im_bands[2], im_bands[3],
+                                 im_bands[4], im_bands[7]]
+                    im_fn[''] = im_date + '_' + satname + '_' + inputs['sitename'] + suffix
+                    # if two images taken at the same date add 'dup' to the name (duplicate)
+                    if any(im_fn[''] in _ for _ in all_names):
+                        im_fn[''] = im_date + '_' + satname + '_' + inputs['sitename'] + '_dup' + suffix
+                    all_names.append(im_fn[''])
+                    filenames.append(im_fn[''])
+                    # metadata for .txt file
+                    filename_txt = im_fn[''].replace('.tif','')
+                    metadict = {'filename':im_fn[''],'acc_georef':georef_accs[i],
+                                'epsg':im_epsg[i]}
+
+                # Landsat 7 and 8 download
+                elif satname in ['L7', 'L8', 'L9']:
+                    if satname == 'L7':
+                        bands['pan'] = [im_bands[8]] # panchromatic band
+                        bands['ms'] = [im_bands[0], im_bands[1], im_bands[2], im_bands[3],
+                                       im_bands[4], im_bands[9]] # multispectral bands
+                    else:
+                        bands['pan'] = [im_bands[7]] # panchromatic band
+                        bands['ms'] = [im_bands[1], im_bands[2], im_bands[3], im_bands[4],
+                                       im_bands[5], im_bands[11]] # multispectral bands
                     for key in bands.keys():
-                        im_fn[key] = im_date + '_' + satname + '_' + inputs['sitename'] + '_' + key + '_dup' + suffix
-                all_names.append(im_fn['pan'])
-                filenames.append(im_fn['pan'])
-                # download .tif from EE (panchromatic band and multispectral bands)
-                while True:
-                    try:
-                        im_ee = ee.Image(im_meta['id'])
-                        local_data_pan = download_tif(im_ee, inputs['polygon'], bands['pan'], filepaths[1])
-                        local_data_ms = download_tif(im_ee, inputs['polygon'], bands['ms'], filepaths[2])
-                        break
-                    except:
-                        continue
-                # rename the files as the image is downloaded as 'data.tif'
-                try: # panchromatic
-                    os.rename(local_data_pan, os.path.join(filepaths[1], im_fn['pan']))
-                except: # overwrite if already exists
-                    os.remove(os.path.join(filepaths[1], im_fn['pan']))
-                    os.rename(local_data_pan, os.path.join(filepaths[1], im_fn['pan']))
-                try: # multispectral
-                    os.rename(local_data_ms, os.path.join(filepaths[2], im_fn['ms']))
-                except: # overwrite if already exists
-                    os.remove(os.path.join(filepaths[2], im_fn['ms']))
-                    os.rename(local_data_ms, os.path.join(filepaths[2], im_fn['ms']))
-                # metadata for .txt file
-                filename_txt = im_fn['pan'].replace('_pan','').replace('.tif','')
-                metadict = {'filename':im_fn['pan'],'acc_georef':georef_accs[i],
-                            'epsg':im_epsg[i]}
-
-            # Sentinel-2 download
-            elif satname in ['S2']:
-                bands['10m'] = [im_bands[1], im_bands[2], im_bands[3], im_bands[7]] # multispectral bands
-                bands['20m'] = [im_bands[11]] # SWIR band
-                bands['60m'] = [im_bands[15]] # QA band
-                for key in bands.keys():
-                    im_fn[key] = im_date + '_' + satname + '_' + inputs['sitename'] + '_' + key + suffix
-                # if two images taken at the same date add 'dup' to the name (duplicate)
-                if any(im_fn['10m'] in _ for _ in all_names):
+                        im_fn[key] = im_date + '_' + satname + '_' + inputs['sitename'] + '_' + key + suffix
+                    # if two images taken at the same date add 'dup' to the name (duplicate)
+                    if any(im_fn['pan'] in _ for _ in all_names):
+                        for key in bands.keys():
+                            im_fn[key] = im_date + '_' + satname + '_' + inputs['sitename'] + '_' + key + '_dup' + suffix
+                    all_names.append(im_fn['pan'])
+                    filenames.append(im_fn['pan'])
+                    # metadata for .txt file
+                    filename_txt = im_fn['pan'].replace('_pan','').replace('.tif','')
+                    metadict = {'filename':im_fn['pan'],'acc_georef':georef_accs[i],
+                                'epsg':im_epsg[i]}
+
+                # Sentinel-2 download
+                elif satname in ['S2']:
+                    bands['10m'] = [im_bands[1], im_bands[2], im_bands[3], im_bands[7]] # multispectral bands
+                    bands['20m'] = [im_bands[11]] # SWIR band
+                    bands['60m'] = [im_bands[15]] # QA band
                     for key in bands.keys():
-                        im_fn[key] = im_date + '_' + satname + '_' + inputs['sitename'] + '_' + key + '_dup2' + suffix
-                    # also check for triplicates (only on S2 imagery) and add 'tri' to the name
-                    if im_fn['10m'] in all_names:
+                        im_fn[key] = im_date + '_' + satname + '_' + inputs['sitename'] + '_' + key + suffix
+                    # if two images taken at the same date add 'dup' to the name (duplicate)
+                    if any(im_fn['10m'] in _ for _ in all_names):
                         for key in bands.keys():
-                            im_fn[key] = im_date + '_' + satname + '_' + inputs['sitename'] + '_' + key + '_dup3' + suffix
-                        # also check for quadruplicates (only on S2 imagery) add 'qua' to the name
+                            im_fn[key] = im_date + '_' + satname + '_' + inputs['sitename'] + '_' + key + '_dup2' + suffix
+                        # also check for triplicates (only on S2 imagery) and add 'tri' to the name
                         if im_fn['10m'] in all_names:
                             for key in bands.keys():
-                                im_fn[key] = im_date + '_' + satname + '_' + inputs['sitename'] + '_' + key + '_dup4' + suffix
-                all_names.append(im_fn['10m'])
-                filenames.append(im_fn['10m'])
-                # download .tif from EE (multispectral bands at 3 different resolutions)
-                while True:
-                    try:
-                        im_ee = ee.Image(im_meta['id'])
-                        local_data_10m = download_tif(im_ee, inputs['polygon'], bands['10m'], filepaths[1])
-                        local_data_20m = download_tif(im_ee, inputs['polygon'], bands['20m'], filepaths[2])
-                        local_data_60m = download_tif(im_ee, inputs['polygon'], bands['60m'], filepaths[3])
-                        break
-                    except:
-                        continue
-                # rename the files as the image is downloaded as 'data.tif'
-                try: # 10m
-                    os.rename(local_data_10m, os.path.join(filepaths[1], im_fn['10m']))
-                except: # overwrite if already exists
-                    os.remove(os.path.join(filepaths[1], im_fn['10m']))
-                    os.rename(local_data_10m, os.path.join(filepaths[1], im_fn['10m']))
-                try: # 20m
-                    os.rename(local_data_20m, os.path.join(filepaths[2], im_fn['20m']))
-                except: # overwrite if already exists
-                    os.remove(os.path.join(filepaths[2], im_fn['20m']))
-                    os.rename(local_data_20m, os.path.join(filepaths[2], im_fn['20m']))
-                try: # 60m
-                    os.rename(local_data_60m, os.path.join(filepaths[3], im_fn['60m']))
-                except: # overwrite if already exists
-                    os.remove(os.path.join(filepaths[3], im_fn['60m']))
-                    os.rename(local_data_60m, os.path.join(filepaths[3], im_fn['60m']))
-                # metadata for .txt file
-                filename_txt = im_fn['10m'].replace('_10m','').replace('.tif','')
-                metadict = {'filename':im_fn['10m'],'acc_georef':georef_accs[i],
-                            'epsg':im_epsg[i]}
-
-            # write metadata
-            with open(os.path.join(filepaths[0],filename_txt + '.txt'), 'w') as f:
-                for key in metadict.keys():
-                    f.write('%s\t%s\n'%(key,metadict[key]))
-            # print percentage completion for user
-            print('\r%d%%' %int((i+1)/len(im_dict_T1[satname])*100), end='')
-
-        print('')
+                                im_fn[key] = im_date + '_' + satname + '_' + inputs['sitename'] + '_' + key + '_dup3' + suffix
+                            # also check for quadruplicates (only on S2 imagery) add 'qua' to the name
+                            if im_fn['10m'] in all_names:
+                                for key in bands.keys():
+                                    im_fn[key] = im_date + '_' + satname + '_' + inputs['sitename'] + '_' + key + '_dup4' + suffix
+                    all_names.append(im_fn['10m'])
+                    filenames.append(im_fn['10m'])
+                    # metadata for .txt file
+                    filename_txt = im_fn['10m'].replace('_10m','').replace('.tif','')
+                    metadict = {'filename':im_fn['10m'],'acc_georef':georef_accs[i],
+                                'epsg':im_epsg[i]}
+
+                # create the download urls on the main thread (the ee client is not thread-safe)
+                im_ee = ee.Image(im_meta['id'])
+                urls = dict([])
+                try:
+                    for key in bands.keys():
+                        urls[key] = call_with_retries(get_download_url, im_ee, inputs['polygon'],
+                                                      bands[key], os.path.splitext(im_fn[key])[0])
+                except download_errors as e:
+                    # skip this image (no .txt file is written, so it is not in the metadata)
+                    print('\nWARNING: could not download %s, skipping it (%s)'%(filename_txt, e))
+                    n_skipped += 1
+                    continue
+                # download the .tif files in the background
+                futures.append(executor.submit(download_image, urls, im_fn, filepaths,
+                                               filename_txt, metadict))
+                # print percentage completion for user (images downloaded and requested so far)
+                n_done = np.sum([_.done() for _ in futures]) + n_skipped
+                print('\r%d%% (%d%% requested)' %(int(n_done/n_images*100),
+                                                  int((i+1)/n_images*100)), end='')
+
+            # wait for the downloads to finish
+            for i, future in enumerate(as_completed(futures)):
+                future.result()
+                # print percentage completion for user
+                print(('\r%d%%' %int((i+1+n_skipped)/n_images*100)).ljust(25), end='')
+
+            print('')
+    finally:
+        # if anything went wrong, do not leave downloads running in the background
+        for future in futures: future.cancel()
+        executor.shutdown(wait=True)
 
     # once all images have been downloaded, load metadata from .txt files
     metadata = get_metadata(inputs)
@@ -502,14 +486,16 @@ def get_image_info(collection,satname,polygon,dates):
     return im_list
 
 
-def download_tif(image, polygon, bandsId, filepath):
+def get_download_url(image, polygon, bandsId, name):
     """
-    Downloads a .TIF image from the ee server. The image is downloaded as a
-    zip file then moved to the working directory, unzipped and stacked into a
-    single .TIF file.
+    Creates the url to download a .TIF image from the ee server. The bands are
+    cropped on the server and, with the newer versions of the earth-engine-api,
+    downloaded directly as a single multi-band GeoTIFF file (no zip file and no
+    task in the export queue). This function calls the ee server, so it should
+    not be called from several threads at the same time.
 
     Two different codes based on which version of the earth-engine-api is being
-    used.
+    used (the old versions still download a zip file).
 
     KV WRL 2018
 
@@ -522,11 +508,14 @@ def download_tif(image, polygon, bandsId, filepath):
         longitudes in the first column and latitudes in the second column
     bandsId: list of dict
         list of bands to be downloaded
-    filepath: location where the temporary file should be saved
+    name: str
+        name of the downloaded file (without extension), needs to be unique
+        when several images are downloaded in the same folder at the same time
 
     Returns:
     -----------
-    Downloads an image in a file named data.tif
+    url: str
+        url to download the image
 
     """
 
@@ -537,46 +526,173 @@ def download_tif(image, polygon, bandsId, filepath):
             'region': polygon,
             'bands': bandsId,
             'filePerBand': 'false',
-            'name': 'data',
+            'name': name,
             }))
-        local_zip, headers = urlretrieve(url)
-        with zipfile.ZipFile(local_zip) as local_zipfile:
-            return local_zipfile.extract('data.tif', filepath)
     # for the newer versions of ee
     else:
-        # crop image on the server and create url to download
-        url = ee.data.makeDownloadUrl(ee.data.getDownloadId({
-            'image': image,
+        # a GeoTIFF can only store one data type, so cast the bands to float if they differ
+        image = image.select([_['id'] for _ in bandsId])
+        if len(set([_['data_type']['precision'] for _ in bandsId])) > 1:
+            image = image.toFloat()
+        # crop image on the server and create url to download it as a single GeoTIFF
+        url = image.getDownloadURL({
+            'name': name,
             'region': polygon,
-            'bands': bandsId,
-            'filePerBand': 'false',
-            'name': 'data',
-            }))
-        # download zipfile with the cropped bands
-        local_zip, headers = urlretrieve(url)
-        # move zipfile from temp folder to data folder
-        dest_file = os.path.join(filepath, 'imagezip')
-        shutil.move(local_zip,dest_file)
-        # unzip file
-        with zipfile.ZipFile(dest_file) as local_zipfile:
-            for fn in local_zipfile.namelist():
-                local_zipfile.extract(fn, filepath)
-            # filepath + filename to single bands
-            fn_tifs = [os.path.join(filepath,_) for _ in local_zipfile.namelist()]
-        # stack bands into single .tif
-        outds = gdal.BuildVRT(os.path.join(filepath,'stacked.vrt'), fn_tifs, separate=True)
-        outds = gdal.Translate(os.path.join(filepath,'data.tif'), outds)
-        # delete single-band files
-        for fn in fn_tifs: os.remove(fn)
-        # delete .vrt file
-        os.remove(os.path.join(filepath,'stacked.vrt'))
-        # delete zipfile
-        os.remove(dest_file)
-        # delete data.tif.aux (not sure why this is created)
-        if os.path.exists(os.path.join(filepath,'data.tif.aux')):
-            os.remove(os.path.join(filepath,'data.tif.aux'))
-        # return filepath to stacked file called data.tif
-        return os.path.join(filepath,'data.tif')
+            'crs': bandsId[0]['crs'],
+            'crs_transform': bandsId[0]['crs_transform'],
+            'format': 'GEO_TIFF',
+            })
+    return url
+
+def download_tif(url, filepath, name):
+    """
+    Downloads a .TIF image from a url created by get_download_url and stores it
+    with lossless DEFLATE compression. The download is kept in memory, so the
+    compressed file is the only one written to disk. Only HTTP requests are made
+    here (no call to the ee client), so several images can be downloaded in parallel.
+
+    Arguments:
+    -----------
+    url: str
+        url created by get_download_url
+    filepath: str
+        location where the file should be saved
+    name: str
+        name of the downloaded file (without extension)
+
+    Returns:
+    -----------
+    Downloads an image in a file named name.tif
+
+    """
+
+    # for the old version of ee only
+    if int(ee.__version__[-3:]) <= 201:
+        # download zipfile directly into the data folder (with a .zip extension)
+        fn_zip = os.path.join(filepath, name + '.zip')
+        urlretrieve(url, fn_zip)
+        # extract the stacked .tif file and delete the zipfile
+        with zipfile.ZipFile(fn_zip) as local_zipfile:
+            fn_tif = local_zipfile.extract(name + '.tif', filepath)
+        os.remove(fn_zip)
+        return fn_tif
+    # for the newer versions of ee
+    else:
+        # download the stacked .tif file in memory (the crop is limited to a few tens of MB)
+        response = http_session.get(url, timeout=300)
+        response.raise_for_status()
+        fn_mem = '/vsimem/' + name + '.tif'
+        gdal.FileFromMemBuffer(fn_mem, response.content)
+        # write it once to the data folder as a losslessly compressed GeoTIFF,
+        # with the predictor matching the data type (3 for floats, 2 for integers)
+        fn_tif = os.path.join(filepath, name + '.tif')
+        fn_download = os.path.join(filepath, name + '_download.tif')
+        outds = None
+        ds = gdal.Open(fn_mem)
+        if ds is not None:
+            if ds.GetRasterBand(1).DataType in [gdal.GDT_Float32, gdal.GDT_Float64]:
+                predictor = 3
+            else:
+                predictor = 2
+            outds = gdal.Translate(fn_tif, ds, creationOptions=['COMPRESS=DEFLATE',
+                                                                'PREDICTOR=%d'%predictor])
+        ds = None
+        gdal.Unlink(fn_mem)
+        # gdal does not raise exceptions here, so check that the file was written
+        if outds is None:
+            if os.path.exists(fn_tif): os.remove(fn_tif)
+            # keep the raw file that could not be translated
+            with open(fn_download, 'wb') as f:
+                f.write(response.content)
+            raise RuntimeError('could not write %s, the raw download is in %s'%(fn_tif, fn_download))
+        outds = None
+        # remove the raw file left by a previous failed attempt
+        if os.path.exists(fn_download): os.remove(fn_download)
+        return fn_tif
+
+def download_image(urls, im_fn, filepaths, filename_txt, metadict):
+    """
+    Downloads all the bands of a single image (one .TIF file per group of bands)
+    and writes the corresponding metadata .txt file. Each image is downloaded
+    under its final filename, so that several images can be downloaded in
+    parallel from retrieve_images.
+
+    Arguments:
+    -----------
+    urls: dict
+        url created by get_download_url for each group of bands (e.g., 'pan' and 'ms')
+    im_fn: dict
+        filename of the .TIF file for each group of bands (same keys as urls)
+    filepaths: list of str
+        folders created by create_folder_structure (metadata folder first,
+        then one folder for each group of bands)
+    filename_txt: str
+        name of the metadata .txt file (without extension)
+    metadict: dict
+        metadata to write in the .txt file
+
+    Returns:
+    -----------
+    Downloads the .TIF files and writes the metadata .txt file. If one of the
+    files cannot be downloaded, the image is skipped and its files are deleted.
+
+    """
+
+    # download each group of bands in its own subfolder
+    try:
+        for j,key in enumerate(urls.keys()):
+            call_with_retries(download_tif, urls[key], filepaths[j+1],
+                              os.path.splitext(im_fn[key])[0])
+    except download_errors as e:
+        # delete the files already downloaded for this image and skip it
+        # (no .txt file is written, so it is not in the metadata)
+        for j,key in enumerate(urls.keys()):
+            name = os.path.splitext(im_fn[key])[0]
+            for fn in [name + '.tif', name + '_download.tif', name + '.zip']:
+                if os.path.exists(os.path.join(filepaths[j+1], fn)):
+                    os.remove(os.path.join(filepaths[j+1], fn))
+        print('\nWARNING: could not download %s, skipping it (%s)'%(filename_txt, e))
+        return
+    # write metadata
+    with open(os.path.join(filepaths[0],filename_txt + '.txt'), 'w') as f:
+        for key in metadict.keys():
+            f.write('%s\t%s\n'%(key,metadict[key]))
+
+def call_with_retries(func, *args, n_attempts=5):
+    """
+    Calls a function that sends requests to the ee server and retries it with an
+    exponential backoff (1, 2, 4 and 8 seconds) when it fails with a transient
+    error. Permanent errors (request too large or HTTP 4xx other than 429) are
+    raised straight away and the last error is raised after n_attempts.
+
+    Arguments:
+    -----------
+    func: function
+        function to call
+    *args:
+        arguments passed to func
+    n_attempts: int
+        maximum number of attempts
+
+    Returns:
+    -----------
+    The output of func
+
+    """
+
+    for attempt in range(n_attempts):
+        try:
+            return func(*args)
+        except download_errors as e:
+            # these errors will not go away by sending the same request again
+            if isinstance(e, ee.EEException) and 'request size' in str(e).lower():
+                raise
+            if (isinstance(e, requests.exceptions.HTTPError) and e.response is not None
+                and 400 <= e.response.status_code < 500 and e.response.status_code != 429):
+                raise
+            if attempt == n_attempts - 1:
+                raise
+            time.sleep(2**attempt)
 
 
 def create_folder_structure(im_folder, satname):
@@ -643,10 +759,11 @@ def remove_cloudy_images(im_list, satname, prc_cloud_cover=95):
         cloud_property = 'CLOUD_COVER'
     elif satname in ['S2']:
         cloud_property = 'CLOUDY_PIXEL_PERCENTAGE'
-    cloud_cover = [_['properties'][cloud_property] for _ in im_list]
-    if np.any([_ > prc_cloud_cover for _ in cloud_cover]):
-        idx_delete = np.where([_ > prc_cloud_cover for _ in cloud_cover])[0]
-        im_list_upt = [x for k,x in enumerate(im_list) if k not in idx_delete]
+    cloud_cover = np.array([_['properties'][cloud_property] for _ in im_list])
+    if np.any(cloud_cover > prc_cloud_cover):
+        # boolean mask of the images to delete
+        idx_delete = cloud_cover > prc_cloud_cover
+        im_list_upt = [x for k,x in enumerate(im_list) if not idx_delete[k]]
     else:
         im_list_upt = im_list
 
@@ -674,32 +791,29 @@ def filter_S2_collection(im_list):
         filtered list of images
     """
 
-    # get datetimes
-    timestamps = [datetime.fromtimestamp(_['properties']['system:time_start']/1000,
-                                         tz=pytz.utc) for _ in im_list]
+    # get timestamps in seconds (converted once, outside of the loop)
+    timestamps = np.array([_['properties']['system:time_start']/1000 for _ in im_list])
     # get utm zone projections
     utm_zones = np.array([int(_['bands'][0]['crs'][5:]) for _ in im_list])
     if len(np.unique(utm_zones)) == 1:
         return im_list
     else:
         utm_zone_selected =  np.max(np.unique(utm_zones))
+        same_utm = utm_zones == utm_zone_selected
         # find the images that were acquired at the same time but have different utm zones
-        idx_all = np.arange(0,len(im_list),1)
-        idx_covered = np.ones(len(im_list)).astype(bool)
-        idx_delete = []
+        idx_covered = np.ones(len(im_list), dtype=bool)
+        idx_delete = np.zeros(len(im_list), dtype=bool)
         i = 0
         while 1:
-            same_time = np.abs([(timestamps[i]-_).total_seconds() for _ in timestamps]) < 60*60*24
+            same_time = np.abs(timestamps - timestamps[i]) < 60*60*24
             idx_same_time = np.where(same_time)[0]
-            same_utm = utm_zones == utm_zone_selected
             # get indices that have the same time (less than 24h apart) but not the same utm zone
-            idx_temp = np.where([same_time[j] == True and same_utm[j] == False for j in idx_all])[0]
-            idx_keep = idx_same_time[[_ not in idx_temp for _ in idx_same_time]]
+            idx_temp = np.where(np.logical_and(same_time, ~same_utm))[0]
+            idx_keep = np.where(np.logical_and(same_time, same_utm))[0]
             # if more than 2 images with same date and same utm, drop the last ones
             if len(idx_keep) > 2:
                idx_temp = np.append(idx_temp,idx_keep[-(len(idx_keep)-2):])
-            for j in idx_temp:
-                idx_delete.append(j)
+            idx_delete[idx_temp] = True
             idx_covered[idx_same_time] = False
             if np.any(idx_covered):
                 i = np.where(idx_covered)[0][0]
@@ -707,7 +821,7 @@ def filter_S2_collection(im_list):
                 break
         # update the collection by deleting all those images that have same timestamp
         # and different utm projection
-        im_list_flt = [x for k,x in enumerate(im_list) if k not in idx_delete]
+        im_list_flt = [x for k,x in enumerate(im_list) if not idx_delete[k]]
 
     return im_list_flt
 
@@ -765,10 +879,11 @@ def merge_overlapping_images(metadata,inputs):
     # nested function
     def duplicates_dict(lst):
         "return duplicates and indices"
-        def duplicates(lst, item):
-                return [i for i, x in enumerate(lst) if x == item]
-
-        return dict((x, duplicates(lst, x)) for x in set(lst) if lst.count(x) > 1)    
+        # group the indices of each item in a single pass
+        groups = dict([])
+        for i, x in enumerate(lst):
+            groups.setdefault(x, []).append(i)
+        return dict((x, idx) for x, idx in groups.items() if len(idx) > 1)
 
     # first pass on images that have the exact same timestamp
     duplicates = duplicates_dict([_.split('_')[0] for _ in filenames])
@@ -833,19 +948,18 @@ def merge_overlapping_images(metadata,inputs):
     
     # find the pairs of images that are within 5 minutes of each other and merge them
     time_delta = 5*60 # 5 minutes in seconds
-    dates = metadata[sat]['dates'].copy()
+    # convert the dates to timestamps (in seconds) only once
+    timestamps = np.array([_.timestamp() for _ in metadata[sat]['dates']])
     pairs = []
-    for i,date in enumerate(metadata[sat]['dates']):
-        # dummy value so it does not match it again
-        dates[i] = pytz.utc.localize(datetime(1,1,1) + timedelta(days=i+1))
-        # calculate time difference
-        time_diff = np.array([np.abs((date - _).total_seconds()) for _ in dates])
+    for i in range(len(timestamps)):
+        # calculate time difference with the images that come after (so it does not match it again)
+        time_diff = np.abs(timestamps[i+1:] - timestamps[i])
         # find the matching times and add to pairs list
         boolvec = time_diff <= time_delta
         if np.sum(boolvec) == 0:
             continue
         else:
-            idx_dup = np.where(boolvec)[0][0]
+            idx_dup = i + 1 + np.where(boolvec)[0][0]
             pairs.append([i,idx_dup])
     total_merged_step2 = len(pairs)        
     # because they could be triplicates in S2 images, adjust the pairs for consecutive merges
@@ -855,7 +969,7 @@ def merge_overlapping_images(metadata,inputs):
             
     # check also for quadruplicates and remove them 
     pair_first = [_[0] for _ in pairs]
-    idx_remove_pair = []
+    idx_remove_pair = np.zeros(len(pairs), dtype=bool)
     for idx in np.unique(pair_first):
         # calculate the number of duplicates
         n_duplicates = sum(pair_first == idx)
@@ -872,9 +986,9 @@ def merge_overlapping_images(metadata,inputs):
                     os.chmod(fn_im[k], 0o777)
                     os.remove(fn_im[k]) 
                 # store the index of the pair to remove it outside the loop
-                idx_remove_pair.append(np.where(pair_first == idx)[0][i])
+                idx_remove_pair[np.where(pair_first == idx)[0][i]] = True
     # remove quadruplicates from list of pairs
-    pairs = [i for j, i in enumerate(pairs) if j not in idx_remove_pair]
+    pairs = [i for j, i in enumerate(pairs) if not idx_remove_pair[j]]
     
     # for each pair of image, first check if one image completely contains the other
     # in that case keep the larger image. Otherwise merge the two images.
@@ -959,16 +1073,12 @@ def merge_overlapping_images(metadata,inputs):
                     else:
                         # create mask for the 20m band (SWIR1) by resampling the 10m one
                         mask20 = ndimage.zoom(mask10,zoom=1/2,order=0)
-                        mask20 = transform.resize(mask20, im_extra.shape, mode='constant',
-                                                  order=0, preserve_range=True)
-                        mask20 = mask20.astype(bool)     
+                        mask20 = SDS_tools.resize_mask(mask20, im_extra.shape)
                     # mask the 20m .tif file (im_extra)
                     SDS_tools.mask_raster(fn_im[index][1], mask20)
                     # create a mask for the 60m QA band by resampling the 20m one
                     mask60 = ndimage.zoom(mask20,zoom=1/3,order=0)
-                    mask60 = transform.resize(mask60, im_QA.shape, mode='constant',
-                                              order=0, preserve_range=True)
-                    mask60 = mask60.astype(bool)
+                    mask60 = SDS_tools.resize_mask(mask60, im_QA.shape)
                     # mask the 60m .tif file (im_QA)
                     SDS_tools.mask_raster(fn_im[index][2], mask60)   
                     # make a figure for quality control/debugging
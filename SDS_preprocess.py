@@ -95,8 +95,7 @@ def preprocess_single(fn, satname, cloud_mask_issue):
         im_ms = transform.resize(im_ms,(nrows, ncols), order=1, preserve_range=True,
                                  mode='constant')
         # resize the image using nearest neighbour interpolation (order 0)
-        cloud_mask = transform.resize(cloud_mask, (nrows, ncols), order=0, preserve_range=True,
-                                      mode='constant').astype('bool_')
+        cloud_mask = SDS_tools.resize_mask(cloud_mask, (nrows, ncols))
 
         # adjust georeferencing vector to the new image size
         # scale becomes 15m and the origin is adjusted to the center of new top left pixel
@@ -106,16 +105,10 @@ def preprocess_single(fn, satname, cloud_mask_issue):
         georef[3] = georef[3] - 7.5
 
         # check if -inf or nan values on any band and eventually add those pixels to cloud mask
-        im_nodata = np.zeros(cloud_mask.shape).astype(bool)
-        for k in range(im_ms.shape[2]):
-            im_inf = np.isin(im_ms[:,:,k], -np.inf)
-            im_nan = np.isnan(im_ms[:,:,k])
-            im_nodata = np.logical_or(np.logical_or(im_nodata, im_inf), im_nan)
+        im_nodata = np.any(np.logical_or(np.isneginf(im_ms), np.isnan(im_ms)), axis=2)
         # check if there are pixels with 0 intensity in the Green, NIR and SWIR bands and add those
         # to the cloud mask as otherwise they will cause errors when calculating the NDWI and MNDWI
-        im_zeros = np.ones(cloud_mask.shape).astype(bool)
-        for k in [1,3,4]: # loop through the Green, NIR and SWIR bands
-            im_zeros = np.logical_and(np.isin(im_ms[:,:,k],0), im_zeros)
+        im_zeros = np.all(im_ms[:,:,[1,3,4]] == 0, axis=2) # Green, NIR and SWIR bands
         # add zeros to im nodata
         im_nodata = np.logical_or(im_zeros, im_nodata)
         # update cloud mask with all the nodata pixels
@@ -155,19 +148,12 @@ def preprocess_single(fn, satname, cloud_mask_issue):
         im_ms = transform.resize(im_ms,(nrows, ncols), order=1, preserve_range=True,
                                  mode='constant')
         # resize the image using nearest neighbour interpolation (order 0)
-        cloud_mask = transform.resize(cloud_mask, (nrows, ncols), order=0, preserve_range=True,
-                                      mode='constant').astype('bool_')
+        cloud_mask = SDS_tools.resize_mask(cloud_mask, (nrows, ncols))
         # check if -inf or nan values on any band and eventually add those pixels to cloud mask
-        im_nodata = np.zeros(cloud_mask.shape).astype(bool)
-        for k in range(im_ms.shape[2]):
-            im_inf = np.isin(im_ms[:,:,k], -np.inf)
-            im_nan = np.isnan(im_ms[:,:,k])
-            im_nodata = np.logical_or(np.logical_or(im_nodata, im_inf), im_nan)
+        im_nodata = np.any(np.logical_or(np.isneginf(im_ms), np.isnan(im_ms)), axis=2)
         # check if there are pixels with 0 intensity in the Green, NIR and SWIR bands and add those
         # to the cloud mask as otherwise they will cause errors when calculating the NDWI and MNDWI
-        im_zeros = np.ones(cloud_mask.shape).astype(bool)
-        for k in [1,3,4]: # loop through the Green, NIR and SWIR bands
-            im_zeros = np.logical_and(np.isin(im_ms[:,:,k],0), im_zeros)
+        im_zeros = np.all(im_ms[:,:,[1,3,4]] == 0, axis=2) # Green, NIR and SWIR bands
         # add zeros to im nodata
         im_nodata = np.logical_or(im_zeros, im_nodata)
         # update cloud mask with all the nodata pixels
@@ -217,19 +203,12 @@ def preprocess_single(fn, satname, cloud_mask_issue):
         im_ms = transform.resize(im_ms,(nrows, ncols), order=1, preserve_range=True,
                                  mode='constant')
         # resize the image using nearest neighbour interpolation (order 0)
-        cloud_mask = transform.resize(cloud_mask, (nrows, ncols), order=0, preserve_range=True,
-                                      mode='constant').astype('bool_')
+        cloud_mask = SDS_tools.resize_mask(cloud_mask, (nrows, ncols))
         # check if -inf or nan values on any band and eventually add those pixels to cloud mask
-        im_nodata = np.zeros(cloud_mask.shape).astype(bool)
-        for k in range(im_ms.shape[2]):
-            im_inf = np.isin(im_ms[:,:,k], -np.inf)
-            im_nan = np.isnan(im_ms[:,:,k])
-            im_nodata = np.logical_or(np.logical_or(im_nodata, im_inf), im_nan)
+        im_nodata = np.any(np.logical_or(np.isneginf(im_ms), np.isnan(im_ms)), axis=2)
         # check if there are pixels with 0 intensity in the Green, NIR and SWIR bands and add those
         # to the cloud mask as otherwise they will cause errors when calculating the NDWI and MNDWI
-        im_zeros = np.ones(cloud_mask.shape).astype(bool)
-        for k in [1,3,4]: # loop through the Green, NIR and SWIR bands
-            im_zeros = np.logical_and(np.isin(im_ms[:,:,k],0), im_zeros)
+        im_zeros = np.all(im_ms[:,:,[1,3,4]] == 0, axis=2) # Green, NIR and SWIR bands
         # add zeros to im nodata
         im_nodata = np.logical_or(im_zeros, im_nodata)
         # update cloud mask with all the nodata pixels
@@ -261,11 +240,11 @@ def preprocess_single(fn, satname, cloud_mask_issue):
         im10 = im10/10000 # TOA scaled to 10000
 
         # if image contains only zeros (can happen with S2), skip the image
-        if sum(sum(sum(im10))) < 1:
+        if np.sum(im10) < 1:
             im_ms = []
             georef = []
             # skip the image by giving it a full cloud_mask
-            cloud_mask = np.ones((im10.shape[0],im10.shape[1])).astype('bool')
+            cloud_mask = np.ones((im10.shape[0],im10.shape[1]), dtype=bool)
             return im_ms, georef, cloud_mask, [], [], []
 
         # size of 10m bands
@@ -296,21 +275,13 @@ def preprocess_single(fn, satname, cloud_mask_issue):
         im_QA = im60[:,:,0]
         cloud_mask = create_cloud_mask(im_QA, satname, cloud_mask_issue)
         # resize the cloud mask using nearest neighbour interpolation (order 0)
-        cloud_mask = transform.resize(cloud_mask,(nrows, ncols), order=0, preserve_range=True,
-                                      mode='constant')
+        cloud_mask = SDS_tools.resize_mask(cloud_mask, (nrows, ncols))
         # check if -inf or nan values on any band and create nodata image
-        im_nodata = np.zeros(cloud_mask.shape).astype(bool)
-        for k in range(im_ms.shape[2]):
-            im_inf = np.isin(im_ms[:,:,k], -np.inf)
-            im_nan = np.isnan(im_ms[:,:,k])
-            im_nodata = np.logical_or(np.logical_or(im_nodata, im_inf), im_nan)
+        im_nodata = np.any(np.logical_or(np.isneginf(im_ms), np.isnan(im_ms)), axis=2)
         # check if there are pixels with 0 intensity in the Green, NIR and SWIR bands and add those
         # to the cloud mask as otherwise they will cause errors when calculating the NDWI and MNDWI
-        im_zeros = np.ones(im_nodata.shape).astype(bool)
-        im_zeros = np.logical_and(np.isin(im_ms[:,:,1],0), im_zeros) # Green
-        im_zeros = np.logical_and(np.isin(im_ms[:,:,3],0), im_zeros) # NIR
-        im_20_zeros = transform.resize(np.isin(im20,0),(nrows, ncols), order=0,
-                                       preserve_range=True, mode='constant').astype(bool)
+        im_zeros = np.all(im_ms[:,:,[1,3]] == 0, axis=2) # Green and NIR
+        im_20_zeros = SDS_tools.resize_mask(im20 == 0, (nrows, ncols))
         im_zeros = np.logical_and(im_20_zeros, im_zeros) # SWIR1
         # add to im_nodata
         im_nodata = np.logical_or(im_zeros, im_nodata)
@@ -366,7 +337,7 @@ def create_cloud_mask(im_QA, satname, cloud_mask_issue):
 
     # remove cloud pixels that form very thin features. These are beach or swash pixels that are
     # erroneously identified as clouds by the CFMASK algorithm applied to the images by the USGS.
-    if sum(sum(cloud_mask)) > 0 and sum(sum(~cloud_mask)) > 0:
+    if np.any(cloud_mask) and not np.all(cloud_mask):
         morphology.remove_small_objects(cloud_mask, min_size=10, connectivity=1, in_place=True)
 
         if cloud_mask_issue:
@@ -502,14 +473,16 @@ def rescale_image_intensity(im, cloud_mask, prob_high):
         # reshape into a vector
         vec =  im.reshape(im.shape[0] * im.shape[1], im.shape[2])
         # initiliase with NaN values
-        vec_adj = np.ones((len(vec_mask), im.shape[2])) * np.nan
+        vec_adj = np.full((len(vec_mask), im.shape[2]), np.nan)
+        # select the cloud-free pixels once for all the bands
+        vec_valid = vec[~vec_mask,:]
+        # find the higher percentile (based on prob) of all the bands in one pass
+        prc_high = np.percentile(vec_valid, prob_high, axis=0)
         # loop through the bands
         for i in range(im.shape[2]):
-            # find the higher percentile (based on prob)
-            prc_high = np.percentile(vec[~vec_mask, i], prob_high)
             # clip the image around the 2 percentiles and rescale the contrast
-            vec_rescaled = exposure.rescale_intensity(vec[~vec_mask, i],
-                                                      in_range=(prc_low, prc_high))
+            vec_rescaled = exposure.rescale_intensity(vec_valid[:,i],
+                                                      in_range=(prc_low, prc_high[i]))
             vec_adj[~vec_mask,i] = vec_rescaled
         # reshape into image
         im_adj = vec_adj.reshape(im.shape[0], im.shape[1], im.shape[2])
@@ -517,9 +490,10 @@ def rescale_image_intensity(im, cloud_mask, prob_high):
     # if image only has 1 bands (grayscale image)
     else:
         vec =  im.reshape(im.shape[0] * im.shape[1])
-        vec_adj = np.ones(len(vec_mask)) * np.nan
-        prc_high = np.percentile(vec[~vec_mask], prob_high)
-        vec_rescaled = exposure.rescale_intensity(vec[~vec_mask], in_range=(prc_low, prc_high))
+        vec_adj = np.full(len(vec_mask), np.nan)
+        vec_valid = vec[~vec_mask]
+        prc_high = np.percentile(vec_valid, prob_high)
+        vec_rescaled = exposure.rescale_intensity(vec_valid, in_range=(prc_low, prc_high))
         vec_adj[~vec_mask] = vec_rescaled
         im_adj = vec_adj.reshape(im.shape[0], im.shape[1])
 
@@ -638,7 +612,7 @@ def save_jpg(metadata, settings, **kwargs):
             im_ms, georef, cloud_mask, im_extra, im_QA, im_nodata = preprocess_single(fn, satname, settings['cloud_mask_issue'])
 
             # compute cloud_cover percentage (with no data pixels)
-            cloud_cover_combined = np.divide(sum(sum(cloud_mask.astype(int))),
+            cloud_cover_combined = np.divide(np.sum(cloud_mask),
                                     (cloud_mask.shape[0]*cloud_mask.shape[1]))
             if cloud_cover_combined > 0.99: # if 99% of cloudy pixels in image skip
                 continue
@@ -646,8 +620,8 @@ def save_jpg(metadata, settings, **kwargs):
             # remove no data pixels from the cloud mask (for example L7 bands of no data should not be accounted for)
             cloud_mask_adv = np.logical_xor(cloud_mask, im_nodata)
             # compute updated cloud cover percentage (without no data pixels)
-            cloud_cover = np.divide(sum(sum(cloud_mask_adv.astype(int))),
-                                    (sum(sum((~im_nodata).astype(int)))))
+            cloud_cover = np.divide(np.sum(cloud_mask_adv),
+                                    np.sum(~im_nodata))
             # skip image if cloud cover is above threshold
             if cloud_cover > cloud_thresh or cloud_cover == 1:
                 continue
@@ -731,7 +705,7 @@ def get_reference_sl(metadata, settings):
         im_ms, georef, cloud_mask, im_extra, im_QA, im_nodata = preprocess_single(fn, satname, settings['cloud_mask_issue'])
 
         # compute cloud_cover percentage (with no data pixels)
-        cloud_cover_combined = np.divide(sum(sum(cloud_mask.astype(int))),
+        cloud_cover_combined = np.divide(np.sum(cloud_mask),
                                 (cloud_mask.shape[0]*cloud_mask.shape[1]))
         if cloud_cover_combined > 0.99: # if 99% of cloudy pixels in image skip
             continue
@@ -739,8 +713,8 @@ def get_reference_sl(metadata, settings):
         # remove no data pixels from the cloud mask (for example L7 bands of no data should not be accounted for)
         cloud_mask_adv = np.logical_xor(cloud_mask, im_nodata)
         # compute updated cloud cover percentage (without no data pixels)
-        cloud_cover = np.divide(sum(sum(cloud_mask_adv.astype(int))),
-                                (sum(sum((~im_nodata).astype(int)))))
+        cloud_cover = np.divide(np.sum(cloud_mask_adv),
+                                np.sum(~im_nodata))
 
         # skip image if cloud cover is above threshold
         if cloud_cover > settings['cloud_thresh']:
@@ -148,7 +148,7 @@ def extract_shorelines(metadata, settings):
             image_epsg = metadata[satname]['epsg'][i]
             
             # compute cloud_cover percentage (with no data pixels)
-            cloud_cover_combined = np.divide(sum(sum(cloud_mask.astype(int))),
+            cloud_cover_combined = np.divide(np.sum(cloud_mask),
                                     (cloud_mask.shape[0]*cloud_mask.shape[1]))
             if cloud_cover_combined > 0.99: # if 99% of cloudy pixels in image skip
                 continue
@@ -156,8 +156,8 @@ def extract_shorelines(metadata, settings):
             # (for example L7 bands of no data should not be accounted for)
             cloud_mask_adv = np.logical_xor(cloud_mask, im_nodata) 
             # compute updated cloud cover percentage (without no data pixels)
-            cloud_cover = np.divide(sum(sum(cloud_mask_adv.astype(int))),
-                                    (sum(sum((~im_nodata).astype(int)))))
+            cloud_cover = np.divide(np.sum(cloud_mask_adv),
+                                    np.sum(~im_nodata))
             # skip image if cloud cover is above user-defined threshold
             if cloud_cover > settings['cloud_thresh']:
                 continue
@@ -185,7 +185,7 @@ def extract_shorelines(metadata, settings):
             # otherwise use find_wl_contours2 (traditional)
             else:
                 try: # use try/except structure for long runs
-                    if sum(sum(im_labels[:,:,0])) < 10 : # minimum number of sand pixels
+                    if np.sum(im_labels[:,:,0]) < 10 : # minimum number of sand pixels
                         # compute MNDWI image (SWIR-G)
                         im_mndwi = SDS_tools.nd_index(im_ms[:,:,4], im_ms[:,:,1], cloud_mask)
                         # find water contours on MNDWI grayscale image
@@ -245,7 +245,7 @@ def extract_shorelines(metadata, settings):
     # save outputput structure as output.pkl
     filepath = os.path.join(filepath_data, sitename)
     with open(os.path.join(filepath, sitename + '_output.pkl'), 'wb') as f:
-        pickle.dump(output, f)
+        pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
 
     return output
 
@@ -278,41 +278,29 @@ def calculate_features(im_ms, cloud_mask, im_bool):
         
     """
 
+    # preallocate the feature matrix (bands, 5 indices and the std of each)
+    n_bands = im_ms.shape[2]
+    features = np.zeros((np.sum(im_bool), 2*(n_bands+5)))
     # add all the multispectral bands
-    features = np.expand_dims(im_ms[im_bool,0],axis=1)
-    for k in range(1,im_ms.shape[2]):
-        feature = np.expand_dims(im_ms[im_bool,k],axis=1)
-        features = np.append(features, feature, axis=-1)
-    # NIR-G
+    for k in range(n_bands):
+        features[:,k] = im_ms[im_bool,k]
+    # NIR-G, SWIR-G, NIR-R, SWIR-NIR and B-R
     im_NIRG = SDS_tools.nd_index(im_ms[:,:,3], im_ms[:,:,1], cloud_mask)
-    features = np.append(features, np.expand_dims(im_NIRG[im_bool],axis=1), axis=-1)
-    # SWIR-G
     im_SWIRG = SDS_tools.nd_index(im_ms[:,:,4], im_ms[:,:,1], cloud_mask)
-    features = np.append(features, np.expand_dims(im_SWIRG[im_bool],axis=1), axis=-1)
-    # NIR-R
     im_NIRR = SDS_tools.nd_index(im_ms[:,:,3], im_ms[:,:,2], cloud_mask)
-    features = np.append(features, np.expand_dims(im_NIRR[im_bool],axis=1), axis=-1)
-    # SWIR-NIR
     im_SWIRNIR = SDS_tools.nd_index(im_ms[:,:,4], im_ms[:,:,3], cloud_mask)
-    features = np.append(features, np.expand_dims(im_SWIRNIR[im_bool],axis=1), axis=-1)
-    # B-R
     im_BR = SDS_tools.nd_index(im_ms[:,:,0], im_ms[:,:,2], cloud_mask)
-    features = np.append(features, np.expand_dims(im_BR[im_bool],axis=1), axis=-1)
+    im_indices = [im_NIRG, im_SWIRG, im_NIRR, im_SWIRNIR, im_BR]
+    for k,im_index in enumerate(im_indices):
+        features[:,n_bands+k] = im_index[im_bool]
     # calculate standard deviation of individual bands
-    for k in range(im_ms.shape[2]):
-        im_std =  SDS_tools.image_std(im_ms[:,:,k], 1)
-        features = np.append(features, np.expand_dims(im_std[im_bool],axis=1), axis=-1)
+    for k in range(n_bands):
+        im_std = SDS_tools.image_std(im_ms[:,:,k], 1)
+        features[:,n_bands+5+k] = im_std[im_bool]
     # calculate standard deviation of the spectral indices
-    im_std = SDS_tools.image_std(im_NIRG, 1)
-    features = np.append(features, np.expand_dims(im_std[im_bool],axis=1), axis=-1)
-    im_std = SDS_tools.image_std(im_SWIRG, 1)
-    features = np.append(features, np.expand_dims(im_std[im_bool],axis=1), axis=-1)
-    im_std = SDS_tools.image_std(im_NIRR, 1)
-    features = np.append(features, np.expand_dims(im_std[im_bool],axis=1), axis=-1)
-    im_std = SDS_tools.image_std(im_SWIRNIR, 1)
-    features = np.append(features, np.expand_dims(im_std[im_bool],axis=1), axis=-1)
-    im_std = SDS_tools.image_std(im_BR, 1)
-    features = np.append(features, np.expand_dims(im_std[im_bool],axis=1), axis=-1)
+    for k,im_index in enumerate(im_indices):
+        im_std = SDS_tools.image_std(im_index, 1)
+        features[:,2*n_bands+5+k] = im_std[im_bool]
 
     return features
 
@@ -351,7 +339,7 @@ def classify_image_NN(im_ms, im_extra, cloud_mask, min_beach_area, clf):
     """
 
     # calculate features
-    vec_features = calculate_features(im_ms, cloud_mask, np.ones(cloud_mask.shape).astype(bool))
+    vec_features = calculate_features(im_ms, cloud_mask, np.ones(cloud_mask.shape, dtype=bool))
     vec_features[np.isnan(vec_features)] = 1e-9 # NaN values are create when std is too close to 0
 
     # remove NaNs and cloudy pixels
@@ -364,8 +352,8 @@ def classify_image_NN(im_ms, im_extra, cloud_mask, min_beach_area, clf):
     # classify pixels
     labels = clf.predict(vec_features)
 
-    # recompose image
-    vec_classif = np.nan*np.ones((cloud_mask.shape[0]*cloud_mask.shape[1]))
+    # recompose image (float32 is enough to store the labels and NaN for the masked pixels)
+    vec_classif = np.full(cloud_mask.shape[0]*cloud_mask.shape[1], np.nan, dtype=np.float32)
     vec_classif[~vec_mask] = labels
     im_classif = vec_classif.reshape((cloud_mask.shape[0], cloud_mask.shape[1]))
 
@@ -545,7 +533,7 @@ def create_shoreline_buffer(im_shape, georef, image_epsg, pixel_size, settings):
 
     """
     # initialise the image buffer
-    im_buffer = np.ones(im_shape).astype(bool)
+    im_buffer = np.ones(im_shape, dtype=bool)
 
     if 'reference_shoreline' in settings.keys():
 
@@ -562,10 +550,8 @@ def create_shoreline_buffer(im_shape, georef, image_epsg, pixel_size, settings):
         ref_sl_pix_rounded = ref_sl_pix_rounded[idx_inside,:]
 
         # create binary image of the reference shoreline (1 where the shoreline is 0 otherwise)
-        im_binary = np.zeros(im_shape)
-        for j in range(len(ref_sl_pix_rounded)):
-            im_binary[ref_sl_pix_rounded[j,1], ref_sl_pix_rounded[j,0]] = 1
-        im_binary = im_binary.astype(bool)
+        im_binary = np.zeros(im_shape, dtype=bool)
+        im_binary[ref_sl_pix_rounded[:,1], ref_sl_pix_rounded[:,0]] = True
 
         # dilate the binary image to create a buffer around the reference shoreline
         max_dist_ref_pixels = np.ceil(settings['max_dist_ref']/pixel_size)
@@ -661,7 +647,7 @@ def process_shoreline(contours, cloud_mask, georef, image_epsg, settings):
     shoreline = contours_array
 
     # now remove any shoreline points that are attached to cloud pixels
-    if sum(sum(cloud_mask)) > 0:
+    if np.any(cloud_mask):
         # get the coordinates of the cloud pixels
         idx_cloud = np.where(cloud_mask)
         idx_cloud = np.array([(idx_cloud[0][k], idx_cloud[1][k]) for k in range(len(idx_cloud[0]))])
@@ -669,7 +655,7 @@ def process_shoreline(contours, cloud_mask, georef, image_epsg, settings):
         coords_cloud = SDS_tools.convert_epsg(SDS_tools.convert_pix2world(idx_cloud, georef),
                                                image_epsg, settings['output_epsg'])[:,:-1]
         # only keep the shoreline points that are at least 30m from any cloud pixel
-        idx_keep = np.ones(len(shoreline)).astype(bool)
+        idx_keep = np.ones(len(shoreline), dtype=bool)
         for k in range(len(shoreline)):
             if np.any(np.linalg.norm(shoreline[k,:] - coords_cloud, axis=1) < 30):
                 idx_keep[k] = False
@@ -1014,22 +1000,22 @@ def adjust_detection(im_ms, cloud_mask, im_labels, im_ref_buffer, image_epsg, ge
     ax4.set_facecolor('0.75')
     ax4.yaxis.grid(color='w', linestyle='--', linewidth=0.5)
     ax4.set(ylabel='PDF',yticklabels=[], xlim=[-1,1])
-    if len(int_sand) > 0 and sum(~np.isnan(int_sand)) > 0:
+    if len(int_sand) > 0 and np.sum(~np.isnan(int_sand)) > 0:
         bins = np.arange(np.nanmin(int_sand), np.nanmax(int_sand) + binwidth, binwidth)
         ax4.hist(int_sand, bins=bins, density=True, color=colours[0,:], label='sand')
-    if len(int_ww) > 0 and sum(~np.isnan(int_ww)) > 0:
+    if len(int_ww) > 0 and np.sum(~np.isnan(int_ww)) > 0:
         bins = np.arange(np.nanmin(int_ww), np.nanmax(int_ww) + binwidth, binwidth)
         ax4.hist(int_ww, bins=bins, density=True, color=colours[1,:], label='whitewater', alpha=0.75) 
-    if len(int_water) > 0 and sum(~np.isnan(int_water)) > 0:
+    if len(int_water) > 0 and np.sum(~np.isnan(int_water)) > 0:
         bins = np.arange(np.nanmin(int_water), np.nanmax(int_water) + binwidth, binwidth)
         ax4.hist(int_water, bins=bins, density=True, color=colours[2,:], label='water', alpha=0.75) 
-    if len(int_other) > 0 and sum(~np.isnan(int_other)) > 0:
+    if len(int_other) > 0 and np.sum(~np.isnan(int_other)) > 0:
         bins = np.arange(np.nanmin(int_other), np.nanmax(int_other) + binwidth, binwidth)
         ax4.hist(int_other, bins=bins, density=True, color='C4', label='other', alpha=0.5) 
     
     # automatically map the shoreline based on the classifier if enough sand pixels
     try:
-        if sum(sum(im_labels[:,:,0])) > 10:
+        if np.sum(im_labels[:,:,0]) > 10:
             # use classification to refine threshold and extract the sand/water interface
             contours_mndwi, t_mndwi = find_wl_contours2(im_ms, im_labels, cloud_mask,
                                                         buffer_size_pixels, im_ref_buffer)
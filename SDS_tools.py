@@ -235,6 +235,42 @@ def image_std(image, radius):
 
     return win_std
 
+def resize_mask(mask, shape):
+    """
+    Resizes a 2D boolean mask using nearest neighbour interpolation. Uses the
+    same pixel-centre convention as transform.resize with order=0 but indexes
+    the rows and columns directly, so the mask is not converted to float64.
+    
+    Arguments:
+    -----------
+    mask: np.array
+        2D array of booleans (e.g., cloud mask)
+    shape: tuple
+        number of rows and columns of the resized mask
+        
+    Returns:    
+    -----------
+    mask_resized: np.array
+        2D array of booleans with the requested shape
+        
+    """ 
+    
+    # nothing to do if the mask already has the requested shape
+    if mask.shape == tuple(shape):
+        return mask
+    # position of the centre of each new pixel in the original pixel grid
+    scale_rows = mask.shape[0]/shape[0]
+    scale_cols = mask.shape[1]/shape[1]
+    rows = (np.arange(shape[0]) + 0.5)*scale_rows - 0.5
+    cols = (np.arange(shape[1]) + 0.5)*scale_cols - 0.5
+    # round to the nearest pixel and make sure the indices are inside the original grid
+    rows = np.clip(np.floor(rows + 0.5), 0, mask.shape[0] - 1).astype(int)
+    cols = np.clip(np.floor(cols + 0.5), 0, mask.shape[1] - 1).astype(int)
+    # pick the nearest pixels
+    mask_resized = mask[np.ix_(rows, cols)]
+
+    return mask_resized
+
 def mask_raster(fn, mask):
     """
     Masks a .tif raster using GDAL.
@@ -428,9 +464,11 @@ def remove_duplicates(output):
     # nested function
     def duplicates_dict(lst):
         "return duplicates and indices"
-        def duplicates(lst, item):
-                return [i for i, x in enumerate(lst) if x == item]
-        return dict((x, duplicates(lst, x)) for x in set(lst) if lst.count(x) > 1)
+        # group the indices of each item in a single pass
+        groups = dict([])
+        for i, x in enumerate(lst):
+            groups.setdefault(x, []).append(i)
+        return dict((x, idx) for x, idx in groups.items() if len(idx) > 1)
 
     dates = output['dates']
     # make a list with year/month/day
@@ -440,12 +478,11 @@ def remove_duplicates(output):
     # if there are duplicates, only keep the first element
     if dupl:
         output_no_duplicates = dict([])
-        idx_remove = []
-        for k,v in dupl.items():
-            idx_remove.append(v[0])
-        idx_remove = sorted(idx_remove)
-        idx_all = np.linspace(0, len(dates_str)-1, len(dates_str))
-        idx_keep = list(np.where(~np.isin(idx_all,idx_remove))[0])
+        idx_remove = [v[0] for v in dupl.values()]
+        # boolean mask of the entries to keep
+        mask_keep = np.ones(len(dates_str), dtype=bool)
+        mask_keep[idx_remove] = False
+        idx_keep = np.where(mask_keep)[0]
         for key in output.keys():
             output_no_duplicates[key] = [output[key][i] for i in idx_keep]
         print('%d duplicates' % len(idx_remove))
@@ -499,7 +536,7 @@ def get_closest_datapoint(dates, dates_ts, values_ts):
     dates: list of datetimes
         dates at which the closest point from the time-series should be extracted
     dates_ts: list of datetimes
-        dates of the long time-series
+        dates of the long time-series (sorted chronologically)
     values_ts: np.array
         array with the values of the long time-series (tides, waves, etc...)
         
@@ -514,16 +551,17 @@ def get_closest_datapoint(dates, dates_ts, values_ts):
     if dates[0] < dates_ts[0] or dates[-1] > dates_ts[-1]: 
         raise Exception('Time-series do not cover the range of your input dates')
     
+    # convert the dates to timestamps (in seconds)
+    timestamps = np.array([_.timestamp() for _ in dates])
+    timestamps_ts = np.array([_.timestamp() for _ in dates_ts])
+    # find the two points of the time-series on each side of the dates (binary search)
+    idx_after = np.searchsorted(timestamps_ts, timestamps)
+    idx_after = np.clip(idx_after, 1, len(timestamps_ts)-1)
+    idx_before = idx_after - 1
     # get closest point to each date (no interpolation)
-    temp = []
-    def find(item, lst):
-        start = 0
-        start = lst.index(item, start)
-        return start
-    for i,date in enumerate(dates):
-        print('\rExtracting closest points: %d%%' % int((i+1)*100/len(dates)), end='')
-        temp.append(values_ts[find(min(item for item in dates_ts if item > date), dates_ts)])
-    values = np.array(temp)
+    after_is_closer = (timestamps - timestamps_ts[idx_before]) > (timestamps_ts[idx_after] - timestamps)
+    idx_closest = np.where(after_is_closer, idx_after, idx_before)
+    values = np.array(values_ts)[idx_closest]
     
     return values
 
@@ -10,6 +10,7 @@ import os
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
 import pdb
 
 # other modules
@@ -91,11 +92,12 @@ def draw_transects(output, settings):
     ax1.set_xlabel('Eastings [m]')
     ax1.set_ylabel('Northings [m]')
     ax1.grid(linestyle=':', color='0.5')
-    for i in range(len(output['shorelines'])):
-        sl = output['shorelines'][i]
-        date = output['dates'][i]
-        ax1.plot(sl[:, 0], sl[:, 1], '.', markersize=3, label=date.strftime('%d-%m-%Y'))
-#    ax1.legend()
+    # plot all the shorelines at once, coloured by date (if any were mapped)
+    if len(output['shorelines']) > 0:
+        sl_all = np.concatenate(output['shorelines'])
+        sl_dates = np.repeat(mdates.date2num(output['dates']), [len(_) for _ in output['shorelines']])
+        sc = ax1.scatter(sl_all[:,0], sl_all[:,1], c=sl_dates, s=9, marker='.', cmap='viridis')
+        fig1.colorbar(sc, ax=ax1, format=mdates.DateFormatter('%d-%m-%Y'), label='date')
     fig1.set_tight_layout(True)
     mng = plt.get_current_fig_manager()                                         
     mng.window.showMaximized()
@@ -14,6 +14,7 @@ import warnings
 warnings.filterwarnings("ignore")
 import matplotlib.pyplot as plt
 from matplotlib import gridspec
+import matplotlib.dates as mdates
 plt.ion()
 import pandas as pd
 from datetime import datetime
@@ -119,11 +120,12 @@ plt.axis('equal')
 plt.xlabel('Eastings')
 plt.ylabel('Northings')
 plt.grid(linestyle=':', color='0.5')
-for i in range(len(output['shorelines'])):
-    sl = output['shorelines'][i]
-    date = output['dates'][i]
-    plt.plot(sl[:,0], sl[:,1], '.', label=date.strftime('%d-%m-%Y'))
-plt.legend()    
+# plot all the shorelines at once, coloured by date (if any were mapped)
+if len(output['shorelines']) > 0:
+    sl_all = np.concatenate(output['shorelines'])
+    sl_dates = np.repeat(mdates.date2num(output['dates']), [len(_) for _ in output['shorelines']])
+    sc = plt.scatter(sl_all[:,0], sl_all[:,1], c=sl_dates, marker='.', cmap='viridis')
+    plt.colorbar(sc, format=mdates.DateFormatter('%d-%m-%Y'), label='date')
 
 #%% 4. Shoreline analysis
 
@@ -161,10 +163,12 @@ plt.axis('equal')
 plt.xlabel('Eastings')
 plt.ylabel('Northings')
 plt.grid(linestyle=':', color='0.5')
-for i in range(len(output['shorelines'])):
-    sl = output['shorelines'][i]
-    date = output['dates'][i]
-    plt.plot(sl[:,0], sl[:,1], '.', label=date.strftime('%d-%m-%Y'))
+# plot all the shorelines at once, coloured by date (if any were mapped)
+if len(output['shorelines']) > 0:
+    sl_all = np.concatenate(output['shorelines'])
+    sl_dates = np.repeat(mdates.date2num(output['dates']), [len(_) for _ in output['shorelines']])
+    sc = plt.scatter(sl_all[:,0], sl_all[:,1], c=sl_dates, marker='.', cmap='viridis')
+    plt.colorbar(sc, format=mdates.DateFormatter('%d-%m-%Y'), label='date')
 for i,key in enumerate(list(transects.keys())):
     plt.plot(transects[key][0,0],transects[key][0,1], 'bo', ms=5)
     plt.plot(transects[key][:,0],transects[key][:,1],'k-',lw=1)
@@ -14,10 +14,18 @@ from datetime import datetime
 from coastsat import SDS_download, SDS_preprocess, SDS_shoreline, SDS_tools, SDS_transects
 
 
+# Earth Engine only needs to be initialised once per session
+ee_initialized = False
+
+
 def hydrata_authenticate():
+    global ee_initialized
+    if ee_initialized:
+        return
     service_account = 'django-coastsat@hydrata-coastsat.iam.gserviceaccount.com'
     credentials = ee.ServiceAccountCredentials(service_account, './coastsat/hydrata-coastsat-3b8ff887df07.json')
     ee.Initialize(credentials)
+    ee_initialized = True
 
 
 def make_springfield():
@@ -59,9 +67,11 @@ def make_springfield():
     sitename = 'SPRINGFIELD'
     # directory where the data will be stored
     filepath = os.path.join(os.getcwd(), 'data')
+    # number of images downloaded in parallel
+    n_workers = 16
     # put all the inputs into a dictionnary
     inputs = {'polygon': polygon, 'dates': dates, 'sat_list': sat_list, 'sitename': sitename, 'filepath':filepath,
-             'landsat_collection': collection}
+             'landsat_collection': collection, 'n_workers': n_workers}
 
     # before downloading the images, check how many images are available for your inputs
     im_dict_T1, im_dict_T2  = SDS_download.check_images_available(inputs)